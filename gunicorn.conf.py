@@ -0,0 +1,30 @@
+"""
+Gunicorn config for the optional Flask backend (optional.py)
+
+gunicorn -c gunicorn.conf.py optional:app
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Threaded workers so long-lived SSE chat streams don't block other requests
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Let clients reuse their connection across chat turns
+keepalive = 75
+timeout = 120
+graceful_timeout = 30
+
+
+def post_worker_init(worker):
+    """Open a TLS connection to Gemini and start the keep-warm thread in each worker"""
+    from optional import SESSION, GEMINI_API_URL, start_keep_warm
+
+    try:
+        SESSION.head(GEMINI_API_URL, timeout=5).close()
+    except Exception as e:
+        worker.log.warning("Gemini warm-up failed: %s", e)
+    start_keep_warm()
@@ -12,26 +12,155 @@ Features:
 Environment:
 - GOOGLE_API_KEY: Your Google AI API key
 - PORT: Server port (default 5000)
+- RENDER_EXTERNAL_URL: Public URL to self-ping (set automatically on Render)
 
-pip install flask flask-cors requests
-python optional.py
+pip install flask flask-cors requests "urllib3>=2.2" orjson cachetools gunicorn brotli
+gunicorn -c gunicorn.conf.py optional:app   (or: python optional.py)
 """
 
 import os
+import atexit
+import sys
+import functools
 import json
 import time
+import threading
+import re
+import queue
+import logging
+import logging.handlers
+import orjson
+from cachetools import TTLCache
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 import base64
-import re
+
+# Log records are queued and written by a background thread, off the request path
+log = logging.getLogger('lepen')
+log.setLevel(logging.INFO)
+log.propagate = False
+_log_queue = queue.SimpleQueue()
+log.addHandler(logging.handlers.QueueHandler(_log_queue))
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
+_log_listener.start()
+# Flush records still queued when the worker exits (e.g. during a SIGTERM drain)
+atexit.register(_log_listener.stop)
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
+app.config['MAX_CONTENT_LENGTH'] = 25 * 1024 * 1024
 
 GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY', '')
 GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models"
 
+# Shared connection pool so Gemini calls reuse kept-alive TCP/TLS connections
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=64,
+    # POSTs are retried only on connect errors and 502/503/504. read=False re-raises
+    # read timeouts/errors at once, so a slow generation is never re-sent (or re-billed).
+    # Once retries run out the last response is returned for the normal .ok handling
+    max_retries=Retry(
+        total=2,
+        read=False,
+        backoff_factor=0.2,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {'POST'},
+        raise_on_status=False
+    )
+))
+SESSION.headers.update({'Connection': 'keep-alive'})
+
+# (connect, read) timeouts so a stalled upstream can't pin a worker thread
+GEMINI_TIMEOUT = (3.05, 120)
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+CHAT_MODEL = 'gemini-2.0-flash'
+IMAGE_MODEL = 'gemini-2.0-flash-exp-image-generation'
+
+def gemini_url(model, stream=False):
+    if stream:
+        return f"{GEMINI_API_URL}/{model}:streamGenerateContent?key={GOOGLE_API_KEY}&alt=sse"
+    return f"{GEMINI_API_URL}/{model}:generateContent?key={GOOGLE_API_KEY}"
+
+# Built once; the API key is fixed for the life of the process
+MODEL_URLS = {
+    (model, stream): gemini_url(model, stream)
+    for model in (CHAT_MODEL, IMAGE_MODEL) for stream in (False, True)
+}
+
+def call_gemini(model, payload, *, stream=False):
+    """POST a payload (dict or pre-encoded bytes) to a Gemini model through the shared pool"""
+    url = MODEL_URLS.get((model, stream)) or gemini_url(model, stream)
+    body = payload if isinstance(payload, bytes) else orjson.dumps(payload)
+    return SESSION.post(url, data=body, headers=JSON_HEADERS, stream=stream, timeout=GEMINI_TIMEOUT)
+
+def first_text(result):
+    """Text of the first candidate's first part, or None"""
+    try:
+        return result['candidates'][0]['content']['parts'][0]['text']
+    except (KeyError, IndexError, TypeError):
+        return None
+
+# Chat system prompts, built once per mode
+CHAT_SYSTEM_PROMPT = """You are Lepen AI, an intelligent assistant. You can help with:
+- General conversations and questions
+- Web searches (use your knowledge to answer)
+- Location and map information
+- Weather information
+- Code generation and debugging
+- Mathematical calculations (format equations properly using LaTeX)
+
+Be helpful, concise, and friendly. When providing code, use markdown code blocks.
+For math equations, use LaTeX format: $inline$ or $$block$$
+Use **bold**, *italic*, and __underline__ for emphasis."""
+
+BUILD_MODE_SUFFIX = "\n\nYou are now in Build mode. Focus on helping with code, programming, and app development. Provide well-structured, clean code with comments."
+
+SYSTEM_INSTRUCTION = {
+    'chat': {"parts": [{"text": CHAT_SYSTEM_PROMPT}]},
+    'code': {"parts": [{"text": CHAT_SYSTEM_PROMPT + BUILD_MODE_SUFFIX}]}
+}
+
+CHAT_GENERATION_CONFIG = {
+    "temperature": 0.7,
+    "maxOutputTokens": 8192
+}
+
+JSON_FENCE_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+JSON_DECODER = json.JSONDecoder()
+
+# Low-temperature search answers, reused for repeat queries
+SEARCH_CACHE = TTLCache(maxsize=1024, ttl=300)
+SEARCH_CACHE_LOCK = threading.Lock()
+
+MAP_SYSTEM_PROMPT = """You are a location assistant. When given a location query:
+1. Identify the locations mentioned
+2. Provide coordinates (latitude/longitude)
+3. Return a JSON response with this format:
+{
+  "locations": [
+    {"name": "Place Name", "lat": 0.0, "lng": 0.0, "description": "Brief description"}
+  ],
+  "center": {"lat": 0.0, "lng": 0.0},
+  "zoom": 12,
+  "message": "Description of the locations"
+}
+Only return valid JSON."""
+
+MAP_SYSTEM_INSTRUCTION = {"parts": [{"text": MAP_SYSTEM_PROMPT}]}
+
+IMAGE_GENERATION_CONFIG = {"responseModalities": ["TEXT", "IMAGE"]}
+WEB_SEARCH_GENERATION_CONFIG = {"temperature": 0.3, "maxOutputTokens": 4096}
+MAP_SEARCH_GENERATION_CONFIG = {"temperature": 0.2, "maxOutputTokens": 2048}
+
 # Cold start tracking
 last_request_time = time.time()
 
@@ -39,6 +168,140 @@ def warm_up():
     global last_request_time
     last_request_time = time.time()
 
+# (second, body) for /api/keepalive, rebuilt at most once per second
+_keepalive_cache = (0, b'')
+
+def keepalive_body():
+    global _keepalive_cache
+    now = int(time.time())
+    second, body = _keepalive_cache
+    if second != now:
+        timestamp = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(now))
+        body = b'{"alive":true,"timestamp":"' + timestamp.encode() + b'"}'
+        _keepalive_cache = (now, body)
+    return body
+
+KEEP_WARM_INTERVAL = 240
+
+def _keep_warm():
+    """Self-ping and keep a TLS connection to Gemini open in the pool"""
+    external_url = os.environ.get('RENDER_EXTERNAL_URL', '').rstrip('/')
+    while True:
+        time.sleep(KEEP_WARM_INTERVAL)
+        try:
+            if external_url:
+                requests.get(f"{external_url}/ping", timeout=5)
+            SESSION.head(GEMINI_API_URL, timeout=5).close()
+        except requests.RequestException:
+            pass
+
+def start_keep_warm():
+    """Start the keep-warm thread; call once per serving process, after any fork"""
+    threading.Thread(target=_keep_warm, name='keep-warm', daemon=True).start()
+
+def gemini_endpoint(error_label):
+    """Shared warm-up, API key check and error handling for Gemini-backed routes"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper():
+            warm_up()
+            if not GOOGLE_API_KEY:
+                return jsonify({'error': 'GOOGLE_API_KEY not configured'}), 500
+            try:
+                return view()
+            except HTTPException:
+                # Keep Flask's own status codes (413 over MAX_CONTENT_LENGTH, 400s)
+                raise
+            except Exception as e:
+                log.exception(error_label)
+                return jsonify({'error': str(e)}), 500
+        return wrapper
+    return decorator
+
+def cached_search(route, query):
+    """Return a cached search response, or None on a miss"""
+    if not isinstance(query, str):
+        return None
+    with SEARCH_CACHE_LOCK:
+        body = SEARCH_CACHE.get((route, query))
+    return Response(body, mimetype='application/json') if body is not None else None
+
+def cache_search(route, query, result):
+    """Serialize a search result once, cache it and return it as a response"""
+    body = orjson.dumps(result)
+    # Only plain string queries are cacheable; other JSON values aren't hashable
+    if isinstance(query, str):
+        with SEARCH_CACHE_LOCK:
+            SEARCH_CACHE[(route, query)] = body
+    return Response(body, mimetype='application/json')
+
+def read_json():
+    """Parse the request body with orjson without caching a copy on the request"""
+    return orjson.loads(request.get_data(cache=False))
+
+def parse_data_url(value):
+    """Split a base64 data URL into (mime_type, data), or None if it isn't one"""
+    if not value or not value.startswith('data:'):
+        return None
+    sep = value.find(';base64,')
+    if sep == -1:
+        return None
+    mime_type = value[5:sep]
+    if not mime_type or ';' in mime_type or sep + 8 == len(value):
+        return None
+    return mime_type, value[sep + 8:]
+
+def build_gemini_content(msg, fallback_image=None):
+    """Convert a chat message into a Gemini content entry"""
+    inline = parse_data_url(msg.get('imageData') or fallback_image)
+    text_part = {"text": msg['content']}
+    return {
+        "role": "user" if msg['role'] == 'user' else "model",
+        "parts": [{"inlineData": {"mimeType": inline[0], "data": inline[1]}}, text_part] if inline else [text_part]
+    }
+
+def parse_map_json(content):
+    """Extract the JSON object from a model reply, fenced in ``` or bare"""
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        pass
+    match = JSON_FENCE_RE.search(content)
+    body = match.group(1) if match else content.strip()
+    return JSON_DECODER.raw_decode(body)[0]
+
+def iter_sse_lines(response, chunk_size=8192):
+    """Yield raw byte lines from a streamed response as soon as they arrive"""
+    buf = bytearray()
+    read1 = getattr(response.raw, 'read1', None)
+    if read1 is not None:
+        chunks = iter(lambda: read1(chunk_size, decode_content=True), b'')
+    else:
+        # urllib3 < 2.2 has no read1(); chunk_size=None yields data as it arrives
+        chunks = response.iter_content(chunk_size=None)
+    for chunk in chunks:
+        buf.extend(chunk)
+        while (nl := buf.find(b'\n')) != -1:
+            line = bytes(buf[:nl]).rstrip(b'\r')
+            del buf[:nl + 1]
+            yield line
+    if buf:
+        yield bytes(buf)
+
+PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'POST, GET, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Max-Age': '86400'
+}
+
+@app.before_request
+def preflight():
+    """Answer CORS preflights before view dispatch; Max-Age lets browsers cache them"""
+    # Unmatched paths have no url_rule and fall through to the normal 404
+    if request.method == 'OPTIONS' and request.url_rule is not None:
+        return '', 204, PREFLIGHT_HEADERS
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -61,312 +324,218 @@ def ping():
 def keepalive():
     """Keep-alive endpoint for Render"""
     warm_up()
-    return jsonify({'alive': True, 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ')})
+    return Response(keepalive_body(), mimetype='application/json')
 
-@app.route('/api/chat', methods=['POST', 'OPTIONS'])
+@app.route('/api/chat', methods=['POST'])
+@gemini_endpoint("Chat error")
 def chat():
     """Streaming Chat endpoint using Gemini 2.0 Flash"""
-    if request.method == 'OPTIONS':
-        return '', 204
-    
-    warm_up()
+    data = read_json()
+    messages = data.get('messages', [])
+    mode = data.get('mode', 'chat')
+    image_data = data.get('imageData')
     
-    if not GOOGLE_API_KEY:
-        return jsonify({'error': 'GOOGLE_API_KEY not configured'}), 500
+    # Build content parts; the request-level image attaches to the last message
+    last = len(messages) - 1
+    gemini_contents = [
+        build_gemini_content(msg, image_data if i == last else None)
+        for i, msg in enumerate(messages)
+    ]
+
+    # Encode once, then drop the parsed request (and any base64 images) so only
+    # the outgoing bytes are alive during the upstream call and the stream
+    body = orjson.dumps({
+        "contents": gemini_contents,
+        "systemInstruction": SYSTEM_INSTRUCTION['code' if mode == 'code' else 'chat'],
+        "generationConfig": CHAT_GENERATION_CONFIG
+    })
+    del gemini_contents, messages, image_data, data
     
+    # Send upstream before streaming so the generator only holds the response
+    upstream, upstream_error = None, None
     try:
-        data = request.json
-        messages = data.get('messages', [])
-        mode = data.get('mode', 'chat')
-        image_data = data.get('imageData')
-        
-        # System prompt
-        system_prompt = """You are Lepen AI, an intelligent assistant. You can help with:
-- General conversations and questions
-- Web searches (use your knowledge to answer)
-- Location and map information
-- Weather information
-- Code generation and debugging
-- Mathematical calculations (format equations properly using LaTeX)
-
-Be helpful, concise, and friendly. When providing code, use markdown code blocks.
-For math equations, use LaTeX format: $inline$ or $$block$$
-Use **bold**, *italic*, and __underline__ for emphasis."""
-
-        if mode == 'code':
-            system_prompt += "\n\nYou are now in Build mode. Focus on helping with code, programming, and app development. Provide well-structured, clean code with comments."
-
-        # Build content parts
-        gemini_contents = []
+        upstream = call_gemini(CHAT_MODEL, body, stream=True)
+    except requests.RequestException as e:
+        upstream_error = str(e)
+    del body
+
+    # Streaming response
+    def generate(response):
+        if response is None:
+            yield b'data: ' + orjson.dumps({"error": upstream_error}) + b'\n\n'
+            return
         
-        for i, msg in enumerate(messages):
-            role = "user" if msg['role'] == 'user' else "model"
-            parts = []
-            
-            # Check if message has image data
-            msg_image = msg.get('imageData') or (image_data if i == len(messages) - 1 else None)
-            if msg_image and msg_image.startswith('data:'):
-                match = re.match(r'^data:([^;]+);base64,(.+)$', msg_image)
-                if match:
-                    parts.append({
-                        "inlineData": {
-                            "mimeType": match.group(1),
-                            "data": match.group(2)
-                        }
-                    })
+        try:
+            if not response.ok:
+                yield b'data: ' + orjson.dumps({"error": "AI API error"}) + b'\n\n'
+                return
             
-            parts.append({"text": msg['content']})
-            gemini_contents.append({"role": role, "parts": parts})
-
-        # Streaming response
-        def generate():
-            url = f"{GEMINI_API_URL}/gemini-2.0-flash:streamGenerateContent?key={GOOGLE_API_KEY}&alt=sse"
+            for line in iter_sse_lines(response):
+                if not line.startswith(b'data: '):
+                    continue
+                try:
+                    content = orjson.loads(line[6:])['candidates'][0]['content']['parts'][0]['text']
+                except (orjson.JSONDecodeError, KeyError, IndexError, TypeError):
+                    continue
+                if content:
+                    yield b'data: ' + orjson.dumps({"choices": [{"delta": {"content": content}}]}) + b'\n\n'
             
-            payload = {
-                "contents": gemini_contents,
-                "systemInstruction": {"parts": [{"text": system_prompt}]},
-                "generationConfig": {
-                    "temperature": 0.7,
-                    "maxOutputTokens": 8192
-                }
-            }
+            yield b'data: [DONE]\n\n'
             
-            try:
-                response = requests.post(url, json=payload, stream=True)
-                
-                if not response.ok:
-                    yield f'data: {json.dumps({"error": "AI API error"})}\n\n'
-                    return
-                
-                for line in response.iter_lines():
-                    if line:
-                        line_str = line.decode('utf-8')
-                        if line_str.startswith('data: '):
-                            try:
-                                data = json.loads(line_str[6:])
-                                if data.get('candidates', [{}])[0].get('content', {}).get('parts', [{}])[0].get('text'):
-                                    content = data['candidates'][0]['content']['parts'][0]['text']
-                                    yield f'data: {json.dumps({"choices": [{"delta": {"content": content}}]})}\n\n'
-                            except:
-                                pass
-                
-                yield 'data: [DONE]\n\n'
-                
-            except Exception as e:
-                yield f'data: {json.dumps({"error": str(e)})}\n\n'
-
-        return Response(
-            stream_with_context(generate()),
-            mimetype='text/event-stream',
-            headers={
-                'Cache-Control': 'no-cache',
-                'Connection': 'keep-alive',
-                'Access-Control-Allow-Origin': '*'
-            }
-        )
-
-    except Exception as e:
-        print(f"Chat error: {e}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/generate-image', methods=['POST', 'OPTIONS'])
+        except Exception as e:
+            yield b'data: ' + orjson.dumps({"error": str(e)}) + b'\n\n'
+        finally:
+            # Return the connection to the pool even if the client disconnects
+            response.close()
+
+    stream = Response(
+        stream_with_context(generate(upstream)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'Connection': 'keep-alive',
+            'X-Accel-Buffering': 'no',
+            'Content-Encoding': 'identity',
+            'Access-Control-Allow-Origin': '*'
+        }
+    )
+    if upstream is not None:
+        # Covers clients that disconnect before the first chunk is pulled
+        stream.call_on_close(upstream.close)
+    return stream
+
+@app.route('/api/generate-image', methods=['POST'])
+@gemini_endpoint("Image generation error")
 def generate_image():
     """Image generation & editing using Gemini 2.0 Flash Image"""
-    if request.method == 'OPTIONS':
-        return '', 204
+    data = read_json()
+    prompt = data.get('prompt', '')
+    image_data = data.get('imageData')
     
-    warm_up()
+    if not prompt:
+        return jsonify({'error': 'Prompt is required'}), 400
+
+    # Build content parts
+    inline = parse_data_url(image_data)
+    is_edit = inline is not None
+    if is_edit:
+        parts = [
+            {"inlineData": {"mimeType": inline[0], "data": inline[1]}},
+            {"text": f"Edit this image: {prompt}"}
+        ]
+    else:
+        parts = [{"text": f"Generate an image: {prompt}"}]
+
+    # Keep only the encoded body alive while the (slow) generation call runs
+    body = orjson.dumps({
+        "contents": [{"parts": parts}],
+        "generationConfig": IMAGE_GENERATION_CONFIG
+    })
+    del parts, inline, image_data, data
+
+    response = call_gemini(IMAGE_MODEL, body)
+    del body
     
-    if not GOOGLE_API_KEY:
-        return jsonify({'error': 'GOOGLE_API_KEY not configured'}), 500
+    if not response.ok:
+        log.error("Image generation error: %s - %s", response.status_code, response.text)
+        return jsonify({'error': 'Image generation failed'}), 500
+
+    result = orjson.loads(response.content)
     
     try:
-        data = request.json
-        prompt = data.get('prompt', '')
-        image_data = data.get('imageData')
-        
-        if not prompt:
-            return jsonify({'error': 'Prompt is required'}), 400
-
-        # Build content parts
-        parts = []
-        is_edit = False
-        
-        if image_data and image_data.startswith('data:'):
-            match = re.match(r'^data:([^;]+);base64,(.+)$', image_data)
-            if match:
-                is_edit = True
-                parts.append({
-                    "inlineData": {
-                        "mimeType": match.group(1),
-                        "data": match.group(2)
-                    }
-                })
-                parts.append({"text": f"Edit this image: {prompt}"})
-        
-        if not is_edit:
-            parts.append({"text": f"Generate an image: {prompt}"})
+        parts = result['candidates'][0]['content']['parts']
+    except (KeyError, IndexError, TypeError):
+        return jsonify({'error': 'No image generated'}), 500
 
-        url = f"{GEMINI_API_URL}/gemini-2.0-flash-exp-image-generation:generateContent?key={GOOGLE_API_KEY}"
-        
-        payload = {
-            "contents": [{"parts": parts}],
-            "generationConfig": {
-                "responseModalities": ["TEXT", "IMAGE"]
-            }
-        }
-
-        response = requests.post(url, json=payload)
-        
-        if not response.ok:
-            error_text = response.text
-            print(f"Image generation error: {response.status_code} - {error_text}")
-            return jsonify({'error': 'Image generation failed'}), 500
+    image_url = None
+    text_content = "Here's your edited image!" if is_edit else "Here's your generated image!"
+    
+    for part in parts:
+        if 'inlineData' in part:
+            mime_type = part['inlineData']['mimeType']
+            b64_data = part['inlineData']['data']
+            image_url = f"data:{mime_type};base64,{b64_data}"
+        elif 'text' in part:
+            text_content = part['text']
+    
+    return jsonify({
+        'imageUrl': image_url,
+        'text': text_content
+    })
 
-        result = response.json()
-        
-        if 'candidates' in result and len(result['candidates']) > 0:
-            parts = result['candidates'][0]['content']['parts']
-            image_url = None
-            text_content = "Here's your edited image!" if is_edit else "Here's your generated image!"
-            
-            for part in parts:
-                if 'inlineData' in part:
-                    mime_type = part['inlineData']['mimeType']
-                    b64_data = part['inlineData']['data']
-                    image_url = f"data:{mime_type};base64,{b64_data}"
-                elif 'text' in part:
-                    text_content = part['text']
-            
-            return jsonify({
-                'imageUrl': image_url,
-                'text': text_content
-            })
-        else:
-            return jsonify({'error': 'No image generated'}), 500
-
-    except Exception as e:
-        print(f"Image generation error: {e}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/web-search', methods=['POST', 'OPTIONS'])
+@app.route('/api/web-search', methods=['POST'])
+@gemini_endpoint("Search error")
 def web_search():
     """Web search using Gemini's grounding capability"""
-    if request.method == 'OPTIONS':
-        return '', 204
+    query = read_json().get('query', '')
     
-    warm_up()
+    cached = cached_search('web-search', query)
+    if cached is not None:
+        return cached
     
-    if not GOOGLE_API_KEY:
-        return jsonify({'error': 'GOOGLE_API_KEY not configured'}), 500
+    response = call_gemini(CHAT_MODEL, {
+        "contents": [{
+            "parts": [{"text": f"Search and provide detailed information about: {query}"}]
+        }],
+        "tools": [{"googleSearch": {}}],
+        "generationConfig": WEB_SEARCH_GENERATION_CONFIG
+    })
     
-    try:
-        data = request.json
-        query = data.get('query', '')
-        
-        url = f"{GEMINI_API_URL}/gemini-2.0-flash:generateContent?key={GOOGLE_API_KEY}"
-        
-        payload = {
-            "contents": [{
-                "parts": [{"text": f"Search and provide detailed information about: {query}"}]
-            }],
-            "tools": [{"googleSearch": {}}],
-            "generationConfig": {
-                "temperature": 0.3,
-                "maxOutputTokens": 4096
-            }
-        }
-
-        response = requests.post(url, json=payload)
-        
-        if not response.ok:
-            return jsonify({'error': 'Search failed'}), 500
+    if not response.ok:
+        return jsonify({'error': 'Search failed'}), 500
 
-        result = response.json()
-        
-        if 'candidates' in result and len(result['candidates']) > 0:
-            content = result['candidates'][0]['content']['parts'][0]['text']
-            return jsonify({'content': content, 'results': content})
-        
+    content = first_text(orjson.loads(response.content))
+    if content is None:
         return jsonify({'error': 'No search results'}), 500
+    
+    return cache_search('web-search', query, {'content': content, 'results': content})
 
-    except Exception as e:
-        print(f"Search error: {e}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/api/map-search', methods=['POST', 'OPTIONS'])
+@app.route('/api/map-search', methods=['POST'])
+@gemini_endpoint("Map search error")
 def map_search():
     """Map/location search using Gemini"""
-    if request.method == 'OPTIONS':
-        return '', 204
+    query = read_json().get('query', '')
     
-    warm_up()
+    cached = cached_search('map-search', query)
+    if cached is not None:
+        return cached
     
-    if not GOOGLE_API_KEY:
-        return jsonify({'error': 'GOOGLE_API_KEY not configured'}), 500
+    response = call_gemini(CHAT_MODEL, {
+        "contents": [{
+            "parts": [{"text": f"Find location information for: {query}"}]
+        }],
+        "systemInstruction": MAP_SYSTEM_INSTRUCTION,
+        "generationConfig": MAP_SEARCH_GENERATION_CONFIG
+    })
     
-    try:
-        data = request.json
-        query = data.get('query', '')
-        
-        url = f"{GEMINI_API_URL}/gemini-2.0-flash:generateContent?key={GOOGLE_API_KEY}"
-        
-        system_prompt = """You are a location assistant. When given a location query:
-1. Identify the locations mentioned
-2. Provide coordinates (latitude/longitude)
-3. Return a JSON response with this format:
-{
-  "locations": [
-    {"name": "Place Name", "lat": 0.0, "lng": 0.0, "description": "Brief description"}
-  ],
-  "center": {"lat": 0.0, "lng": 0.0},
-  "zoom": 12,
-  "message": "Description of the locations"
-}
-Only return valid JSON."""
-
-        payload = {
-            "contents": [{
-                "parts": [{"text": f"Find location information for: {query}"}]
-            }],
-            "systemInstruction": {"parts": [{"text": system_prompt}]},
-            "generationConfig": {
-                "temperature": 0.2,
-                "maxOutputTokens": 2048
-            }
-        }
-
-        response = requests.post(url, json=payload)
-        
-        if not response.ok:
-            return jsonify({'error': 'Location search failed'}), 500
+    if not response.ok:
+        return jsonify({'error': 'Location search failed'}), 500
 
-        result = response.json()
-        
-        if 'candidates' in result and len(result['candidates']) > 0:
-            content = result['candidates'][0]['content']['parts'][0]['text']
-            
-            try:
-                if '```json' in content:
-                    content = content.split('```json')[1].split('```')[0]
-                elif '```' in content:
-                    content = content.split('```')[1].split('```')[0]
-                
-                map_data = json.loads(content.strip())
-                return jsonify({'mapData': map_data, 'content': map_data.get('message', '')})
-            except:
-                return jsonify({'content': content})
-        
+    content = first_text(orjson.loads(response.content))
+    if content is None:
         return jsonify({'error': 'No location results'}), 500
-
-    except Exception as e:
-        print(f"Map search error: {e}")
-        return jsonify({'error': str(e)}), 500
+    
+    try:
+        map_data = parse_map_json(content)
+        return cache_search('map-search', query, {'mapData': map_data, 'content': map_data.get('message', '')})
+    except:
+        return jsonify({'content': content})
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     print(f"\n🚀 Lepen AI Backend starting on port {port}")
     print("📡 Models: Gemini 2.0 Flash (chat/build), Gemini 2.0 Flash Image (images)")
-    print("💡 Deploy to Render with: gunicorn optional:app")
-    print("\n✅ Ready to accept connections!\n")
-    app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
+    print("💡 Deploy to Render with: gunicorn -c gunicorn.conf.py optional:app")
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        print("⚠️  gunicorn not installed, falling back to the development server")
+        print("\n✅ Ready to accept connections!\n")
+        start_keep_warm()
+        app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
+    else:
+        here = os.path.dirname(os.path.abspath(__file__))
+        # execv replaces the process without flushing; stdout is block-buffered on a pipe
+        sys.stdout.flush()
+        # Run gunicorn from this interpreter so a console script missing from PATH doesn't matter
+        os.execv(sys.executable, [sys.executable, '-m', 'gunicorn', '--chdir', here, '-c', os.path.join(here, 'gunicorn.conf.py'), 'optional:app'])